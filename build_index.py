@@ -0,0 +1,150 @@
+"""유니코 AI - 오프라인 인덱스 빌드
+
+CI나 빌드 서버에서 fixed_pdfs의 PDF를 미리 임베딩해 indexes/에 아티팩트로 저장합니다.
+앱은 시작할 때 임베딩 없이 이 아티팩트를 메모리 맵으로 불러옵니다.
+
+사용법:
+    python build_index.py                         # fixed_pdfs → indexes (float16)
+    python build_index.py --dtype int8            # int8 + 행별 스케일
+    python build_index.py --compare               # 원시 float32 대비 크기, Chroma 대비 준비 시간/검색 일치도 비교
+"""
+import argparse
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_community.document_loaders import PyPDFLoader
+
+from index_artifact import (
+    INDEX_DIR,
+    artifact_dir_for,
+    artifact_size,
+    create_embeddings,
+    is_artifact_current,
+    load_artifact,
+    read_manifest,
+    split_documents,
+    write_artifact,
+)
+
+# 앱의 빠른 분석 버튼 질문 - 검색 일치도 비교용
+PROBE_QUESTIONS = [
+    "이 문서의 핵심 재배 방법을 단계별로 요약해주세요.",
+    "최적 재배 환경 조건 (온도, 습도, 광량 등)을 정리해주세요.",
+    "병충해 예방 및 방제 방법을 상세히 설명해주세요.",
+    "재배 비용과 예상 수익, 경제성을 분석해주세요.",
+]
+
+# 앱 기본 검색 설정 (create_rag_chain의 MMR 검색)
+MMR_FETCH_K = 20
+MMR_LAMBDA = 0.5
+
+
+def build_one(pdf_path, out_dir, embeddings, dtype):
+    """PDF 하나를 로드 → 분할 → 임베딩 → 아티팩트 저장"""
+    documents = PyPDFLoader(str(pdf_path)).load()
+    splits = split_documents(documents)
+    if not splits:
+        print(f"⚠️ {pdf_path.name}: 추출된 텍스트가 없어 건너뜁니다")
+        return None
+
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in splits]), dtype=np.float32)
+    embed_sec = time.perf_counter() - start
+
+    manifest = write_artifact(out_dir, pdf_path, documents, splits, vectors, dtype)
+    print(
+        f"✅ {pdf_path.name}: {manifest['count']}개 청크, {manifest['dim']}차원 {dtype}, "
+        f"{artifact_size(out_dir) / 1024:.1f} KB (임베딩 {embed_sec:.1f}초)"
+    )
+    return manifest
+
+
+def agreement(expected_search, actual_search):
+    """질문별 검색 결과 비교 → (평균 overlap, top-1 일치 수)"""
+    overlaps = []
+    top1 = 0
+    for question in PROBE_QUESTIONS:
+        expected = [doc.page_content for doc in expected_search(question)]
+        actual = [doc.page_content for doc in actual_search(question)]
+        overlaps.append(len(set(expected) & set(actual)) / max(1, len(expected)))
+        top1 += bool(expected and actual and expected[0] == actual[0])
+    return np.mean(overlaps), top1
+
+
+def compare(pdf_path, out_dir, embeddings, k):
+    """현재 방식(PDF 처리 + 인메모리 Chroma)과 아티팩트 로드 비교"""
+    start = time.perf_counter()
+    documents = PyPDFLoader(str(pdf_path)).load()
+    splits = split_documents(documents)
+    chroma = Chroma.from_documents(
+        documents=splits,
+        embedding=embeddings,
+        collection_name=f"compare_{uuid.uuid4().hex[:8]}"
+    )
+    chroma_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = load_artifact(out_dir, embeddings)
+    load_sec = time.perf_counter() - start
+
+    manifest = index.manifest
+    float32_bytes = manifest["count"] * manifest["dim"] * 4
+    vector_bytes = (Path(out_dir) / "vectors.npy").stat().st_size
+    if manifest["dtype"] == "int8":
+        vector_bytes += (Path(out_dir) / "scales.npy").stat().st_size
+
+    similarity = agreement(
+        lambda q: chroma.similarity_search(q, k=k),
+        lambda q: index.similarity_search(q, k=k),
+    )
+    # 앱이 실제로 쓰는 검색 방식
+    mmr = agreement(
+        lambda q: chroma.max_marginal_relevance_search(q, k=k, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA),
+        lambda q: index.max_marginal_relevance_search(q, k=k, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA),
+    )
+    chroma.delete_collection()
+
+    # 기준은 Chroma 실제 사용량이 아니라 같은 벡터를 float32로 둘 때의 원시 크기 (HNSW 인덱스/메타데이터 제외)
+    print(f"   📦 벡터 크기: 원시 float32 기준 {float32_bytes / 1024:.1f} KB → {manifest['dtype']} {vector_bytes / 1024:.1f} KB "
+          f"({vector_bytes / max(1, float32_bytes):.0%}, Chroma 인덱스/메타데이터 제외)")
+    print(f"   ⏱️ 준비 시간: PDF 처리 + Chroma {chroma_sec:.2f}초 → 아티팩트 로드 {load_sec * 1000:.1f}ms")
+    print(f"   🔍 검색 일치도 (k={k}, 질문 {len(PROBE_QUESTIONS)}개)")
+    print(f"      MMR (앱 설정 fetch_k={MMR_FETCH_K}, λ={MMR_LAMBDA}): "
+          f"overlap@{k} {mmr[0]:.0%}, top-1 {mmr[1]}/{len(PROBE_QUESTIONS)}")
+    print(f"      유사도 검색: overlap@{k} {similarity[0]:.0%}, top-1 {similarity[1]}/{len(PROBE_QUESTIONS)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="fixed_pdfs의 PDF로 사전 빌드 인덱스 생성")
+    parser.add_argument("--pdf-dir", type=Path, default=Path("fixed_pdfs"), help="PDF 폴더 (기본: fixed_pdfs)")
+    parser.add_argument("--out", type=Path, default=INDEX_DIR, help="아티팩트 폴더 (기본: indexes)")
+    parser.add_argument("--dtype", choices=["float16", "int8"], default="float16", help="벡터 저장 형식")
+    parser.add_argument("--force", action="store_true", help="최신 아티팩트가 있어도 다시 빌드")
+    parser.add_argument("--compare", action="store_true", help="인메모리 Chroma와 크기/로드 시간/검색 일치도 비교")
+    parser.add_argument("--k", type=int, default=5, help="비교 시 검색 개수 (기본: 5 = 앱 기본 참고 문서 깊이)")
+    args = parser.parse_args(argv)
+
+    pdf_files = sorted(args.pdf_dir.glob("*.pdf"))
+    if not pdf_files:
+        print(f"❌ {args.pdf_dir}에 PDF 파일이 없습니다")
+        return 1
+
+    embeddings = create_embeddings()
+    for pdf_path in pdf_files:
+        out_dir = artifact_dir_for(pdf_path, args.out)
+        manifest = read_manifest(out_dir)
+        if not args.force and is_artifact_current(manifest, pdf_path) and manifest["dtype"] == args.dtype:
+            print(f"⏭️ {pdf_path.name}: 최신 아티팩트가 있습니다")
+        elif build_one(pdf_path, out_dir, embeddings, args.dtype) is None:
+            continue
+        if args.compare:
+            compare(pdf_path, out_dir, embeddings, args.k)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""유니코 AI - 사전 빌드 인덱스 아티팩트
+
+`build_index.py`가 PDF를 미리 임베딩해 저장하고, 앱은 시작할 때 메모리 맵으로 불러옵니다.
+
+아티팩트 구조 (indexes/<PDF 이름>/):
+- manifest.json : 포맷 버전, 원본 PDF 해시, 설정 지문(fingerprint), 벡터 형식
+- vectors.npy   : float16 또는 int8 벡터
+- scales.npy    : int8일 때 행별 스케일 (float32)
+- chunks.jsonl  : 청크 본문 + 메타데이터
+- full_text.txt : 페이지 표시가 붙은 전체 텍스트
+"""
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+FORMAT_VERSION = 1
+INDEX_DIR = Path("indexes")
+
+# --- 임베딩 / 청크 설정 (앱과 빌드가 공유) ---
+EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+SEPARATORS = ["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+MIN_CHUNK_CHARS = 50
+
+# 검색 시 한 번에 float32로 변환할 행 수 - 메모리 맵 전체를 복사하지 않도록
+SCORE_BLOCK_ROWS = 4096
+
+
+def create_embeddings():
+    """CPU 다국어 임베딩 모델"""
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True}
+    )
+
+
+def build_full_text(documents):
+    """페이지 표시가 붙은 전체 텍스트"""
+    total_text = ""
+    for doc in documents:
+        page_text = doc.page_content.strip()
+        if page_text:
+            total_text += f"\n[페이지 {doc.metadata.get('page', 'Unknown')}]\n{page_text}\n"
+    return total_text
+
+
+def split_documents(documents):
+    """문서를 분석 단위 청크로 분할"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        separators=SEPARATORS,
+        length_function=len
+    )
+    splits = text_splitter.split_documents(documents)
+    return [doc for doc in splits if len(doc.page_content.strip()) > MIN_CHUNK_CHARS]
+
+
+def index_config():
+    """인덱스 내용에 영향을 주는 설정"""
+    return {
+        "embedding_model": EMBEDDING_MODEL,
+        "normalize_embeddings": True,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "separators": SEPARATORS,
+        "min_chunk_chars": MIN_CHUNK_CHARS,
+    }
+
+
+def config_fingerprint(config=None):
+    """설정 지문 - 설정이 바뀌면 기존 아티팩트는 사용하지 않음"""
+    payload = json.dumps(config or index_config(), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_dir_for(pdf_path, index_dir=INDEX_DIR):
+    return Path(index_dir) / Path(pdf_path).stem
+
+
+# --- 양자화 ---
+def quantize(vectors, dtype):
+    """float32 벡터 → (저장 벡터, 행별 스케일 또는 None)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None]).clip(-127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"지원하지 않는 벡터 형식: {dtype}")
+
+
+# --- 아티팩트 쓰기 ---
+def write_artifact(out_dir, pdf_path, documents, splits, vectors, dtype="float16"):
+    """인덱스 아티팩트를 임시 폴더에 쓴 뒤 교체"""
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    stored, scales = quantize(vectors, dtype)
+    np.save(tmp_dir / "vectors.npy", stored)
+    if scales is not None:
+        np.save(tmp_dir / "scales.npy", scales)
+
+    with open(tmp_dir / "chunks.jsonl", "w", encoding="utf-8") as f:
+        for doc in splits:
+            f.write(json.dumps({"text": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+
+    (tmp_dir / "full_text.txt").write_text(build_full_text(documents), encoding="utf-8")
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": {
+            "name": Path(pdf_path).name,
+            "sha256": file_sha256(pdf_path),
+            "pages": len(documents),
+        },
+        "config": index_config(),
+        "fingerprint": config_fingerprint(),
+        "dtype": dtype,
+        "count": int(stored.shape[0]),
+        "dim": int(stored.shape[1]) if stored.ndim == 2 else 0,
+    }
+    (tmp_dir / "manifest.json").write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    tmp_dir.rename(out_dir)
+    return manifest
+
+
+def artifact_size(artifact_dir):
+    """아티팩트 파일 크기 합계 (바이트)"""
+    return sum(p.stat().st_size for p in Path(artifact_dir).iterdir() if p.is_file())
+
+
+# --- 아티팩트 읽기 ---
+def read_manifest(artifact_dir):
+    path = Path(artifact_dir) / "manifest.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def is_artifact_current(manifest, pdf_path):
+    """포맷 버전, 설정 지문, 원본 PDF 해시가 모두 일치하는지"""
+    return (
+        manifest is not None
+        and manifest.get("format_version") == FORMAT_VERSION
+        and manifest.get("fingerprint") == config_fingerprint()
+        and manifest.get("source", {}).get("sha256") == file_sha256(pdf_path)
+    )
+
+
+def load_artifact(artifact_dir, embedding):
+    """아티팩트를 메모리 맵으로 열어 QuantizedIndex 반환"""
+    artifact_dir = Path(artifact_dir)
+    manifest = read_manifest(artifact_dir)
+    vectors = np.load(artifact_dir / "vectors.npy", mmap_mode="r")
+    scales = None
+    if manifest["dtype"] == "int8":
+        scales = np.load(artifact_dir / "scales.npy")
+
+    documents = []
+    with open(artifact_dir / "chunks.jsonl", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            documents.append(Document(page_content=record["text"], metadata=record["metadata"]))
+
+    full_text = (artifact_dir / "full_text.txt").read_text(encoding="utf-8")
+    return QuantizedIndex(vectors, scales, documents, embedding, manifest, full_text)
+
+
+def load_artifact_for(pdf_path, embedding, index_dir=INDEX_DIR):
+    """PDF에 맞는 최신 아티팩트가 있으면 로드, 없거나 오래됐으면 None"""
+    artifact_dir = artifact_dir_for(pdf_path, index_dir)
+    if not is_artifact_current(read_manifest(artifact_dir), pdf_path):
+        return None
+    return load_artifact(artifact_dir, embedding)
+
+
+# --- 검색 ---
+def _mmr(query_vector, candidates, k, lambda_mult):
+    """최대 한계 관련성(MMR) 선택 - candidates 행 인덱스 반환"""
+    if len(candidates) == 0:
+        return []
+    relevance = candidates @ query_vector
+    selected = [int(np.argmax(relevance))]
+    while len(selected) < min(k, len(candidates)):
+        redundancy = (candidates @ candidates[selected].T).max(axis=1)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        selected.append(int(np.argmax(scores)))
+    return selected
+
+
+class QuantizedIndex(VectorStore):
+    """메모리 맵 양자화 벡터 위의 읽기 전용 벡터 스토어"""
+
+    def __init__(self, vectors, scales, documents, embedding, manifest, full_text=""):
+        self.vectors = vectors
+        self.scales = scales
+        self.documents = documents
+        self.embedding = embedding
+        self.manifest = manifest
+        self.full_text = full_text
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @property
+    def num_chunks(self):
+        return len(self.documents)
+
+    @property
+    def pdf_pages(self):
+        return self.manifest["source"]["pages"]
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("사전 빌드 인덱스는 build_index.py로 만드세요")
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("사전 빌드 인덱스는 읽기 전용입니다")
+
+    def _rows(self, idx):
+        """선택한 행만 float32로 (int8은 스케일 복원)"""
+        rows = np.asarray(self.vectors[idx], dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * self.scales[idx][:, None]
+        return rows
+
+    def _scores(self, query_vector):
+        """블록 단위로 내적 - int8 스케일은 점수에 곱해 복원"""
+        scores = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(scores), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query_vector
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def _top(self, query_vector, k):
+        scores = self._scores(query_vector)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+        return top[np.argsort(-scores[top])], scores
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        top, scores = self._top(np.asarray(embedding, dtype=np.float32), k)
+        return [(self.documents[i], float(scores[i])) for i in top]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def _similarity_search_with_relevance_scores(self, query, k=4, **kwargs):
+        # 정규화된 임베딩이므로 내적 = 코사인 유사도
+        return self.similarity_search_with_score(query, k)
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        query_vector = np.asarray(embedding, dtype=np.float32)
+        top, _ = self._top(query_vector, fetch_k)
+        selected = _mmr(query_vector, self._rows(top), k, lambda_mult)
+        return [self.documents[top[i]] for i in selected]
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding.embed_query(query), k, fetch_k, lambda_mult
+        )
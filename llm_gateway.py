@@ -0,0 +1,360 @@
+"""유니코 AI - 프로세스 전역 LLM 게이트웨이
+
+여러 세션이 같은 질문을 동시에 보내도 Gemini 호출은 한 번만 나가도록 합니다.
+
+- 동일 프롬프트 in-flight 병합 (single-flight)
+- 전역 동시 실행 제한 + 토큰 버킷 속도 제한
+- 세션 간 라운드로빈 공정 대기열
+- 대기열 깊이 / 대기 시간 지표
+- 요청별 지연 예산(budget)과 p95 기반 헤징(hedged retry), 꼬리 지연 통계
+- 예산이 모두 지난 요청은 호출하지 않음, 끝난 결과는 잠시(result_ttl) 재사용
+
+`invoke(prompt)`만 있으면 어떤 LLM이든 감쌀 수 있어 가짜 LLM으로 테스트할 수 있습니다.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from langchain_core.runnables import RunnableLambda
+
+
+# --- 지연 시간 통계 ---
+class LatencyStats:
+    """최근 N개 측정값으로 백분위수 계산"""
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        idx = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[idx]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+# --- 토큰 버킷 ---
+class TokenBucket:
+    """초당 rate개씩 채워지는 토큰 버킷 (최대 capacity개)"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """토큰이 있으면 하나 가져가고 True"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, deadline=None):
+        """토큰이 생길 때까지 대기 후 하나 가져가고 True
+
+        deadline(clock 기준 시각)까지 못 얻으면 토큰을 가져가지 않고 False
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+                now = self._updated
+            if deadline is not None:
+                if now >= deadline:
+                    return False
+                wait = min(wait, deadline - now)
+            self._sleep(wait)
+
+
+# --- 공정 대기열 ---
+class FairQueue:
+    """세션별 대기열을 라운드로빈으로 돌며 동시 실행 슬롯 배분"""
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self._queues = OrderedDict()
+        self._active = 0
+        self.max_depth = 0
+        self._cond = threading.Condition()
+
+    def _depth(self):
+        return sum(len(q) for q in self._queues.values())
+
+    @property
+    def depth(self):
+        with self._cond:
+            return self._depth()
+
+    @property
+    def active(self):
+        with self._cond:
+            return self._active
+
+    def _dispatch(self):
+        while self._active < self.max_concurrency and self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            ticket["granted"] = True
+            self._active += 1
+        self._cond.notify_all()
+
+    def acquire(self, session_id):
+        """슬롯을 얻을 때까지 대기하고 대기 시간(초)을 반환"""
+        ticket = {"granted": False}
+        start = time.monotonic()
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._dispatch()
+            self.max_depth = max(self.max_depth, self._depth())
+            while not ticket["granted"]:
+                self._cond.wait()
+        return time.monotonic() - start
+
+    def try_acquire(self):
+        """기다리는 요청이 없고 빈 슬롯이 있으면 바로 차지하고 True"""
+        with self._cond:
+            if self._queues or self._active >= self.max_concurrency:
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._dispatch()
+
+
+# --- LLM 게이트웨이 ---
+class LatencyBudgetExceeded(TimeoutError):
+    """지연 예산 안에 LLM 응답을 받지 못함"""
+
+
+def run_in_thread(fn, *args):
+    """fn을 데몬 스레드에서 실행하고 Future 반환"""
+    future = Future()
+
+    def target():
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=target, daemon=True).start()
+    return future
+
+
+def prompt_key(prompt):
+    """프롬프트 → 병합용 키"""
+    text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LLMGateway:
+    """모든 세션이 공유하는 LLM 호출 관문"""
+
+    def __init__(self, llm, max_concurrency=4, rate_per_sec=None, burst=None,
+                 budget=None, hedge=False, hedge_min_samples=20, hedge_delay=None,
+                 result_ttl=0, max_results=256):
+        self.llm = llm
+        self.queue = FairQueue(max_concurrency)
+        self.bucket = TokenBucket(rate_per_sec, burst) if rate_per_sec else None
+        self.budget = budget
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.default_hedge_delay = hedge_delay
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.wait_stats = LatencyStats()
+        self.call_stats = LatencyStats()
+        self.hedged_stats = LatencyStats()
+        self._inflight = {}
+        self._deadlines = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "requests": 0, "llm_calls": 0, "coalesced": 0, "errors": 0,
+            "timeouts": 0, "hedges": 0, "hedge_wins": 0, "expired": 0, "cache_hits": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def invoke(self, prompt, session_id="default", budget=None):
+        """동일 프롬프트가 진행 중이면 그 결과를 기다리고, 아니면 새로 호출
+
+        budget(초) 안에 응답이 없으면 LatencyBudgetExceeded를 발생시킵니다.
+        호출 자체는 백그라운드에서 계속되고, 끝난 결과는 result_ttl초 동안
+        같은 질문의 다음 요청이 재사용합니다.
+        """
+        budget = budget if budget is not None else self.budget
+        key = prompt_key(prompt)
+        now = time.monotonic()
+        deadline = now + budget if budget is not None else None
+        with self._lock:
+            self._counters["requests"] += 1
+            cached = self._results.get(key)
+            if cached is not None:
+                if cached[0] > now:
+                    self._counters["cache_hits"] += 1
+                    return cached[1]
+                del self._results[key]
+
+            future = self._inflight.get(key)
+            if future is None:
+                self._deadlines[key] = deadline
+                future = run_in_thread(self._call, prompt, session_id, key)
+                self._inflight[key] = future
+                future.add_done_callback(lambda f: self._finish(key, f))
+            else:
+                self._counters["coalesced"] += 1
+                # 기다리는 요청 중 가장 늦은 예산까지 호출할 가치가 있음
+                current = self._deadlines.get(key)
+                if current is not None:
+                    self._deadlines[key] = None if deadline is None else max(current, deadline)
+
+        # LLM 자체가 낸 TimeoutError와 구분하도록 기다림이 끝났는지로만 예산 초과 판단
+        done, _ = wait([future], timeout=budget)
+        if not done:
+            self._count("timeouts")
+            raise LatencyBudgetExceeded(f"LLM 응답이 {budget:g}초 예산을 초과했습니다")
+        return future.result()
+
+    def _finish(self, key, future):
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._deadlines.pop(key, None)
+            error = future.exception()
+            if isinstance(error, LatencyBudgetExceeded):
+                self._counters["expired"] += 1
+            elif error is not None:
+                self._counters["errors"] += 1
+            elif self.result_ttl > 0:
+                self._results[key] = (time.monotonic() + self.result_ttl, future.result())
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+
+    def _deadline(self, key):
+        with self._lock:
+            return self._deadlines.get(key)
+
+    def _expired(self, key):
+        deadline = self._deadline(key)
+        return deadline is not None and time.monotonic() >= deadline
+
+    def _call(self, prompt, session_id, key):
+        waited = self.queue.acquire(session_id)
+        start = time.monotonic()
+        # 토큰 대기도 예산까지만 - 그 사이 합류한 요청이 예산을 늘렸으면 계속 기다림
+        while not self._expired(key):
+            if self.bucket is None or self.bucket.acquire(deadline=self._deadline(key)):
+                self.wait_stats.record(waited + time.monotonic() - start)
+                return self._hedged_invoke(prompt)
+        # 기다리던 요청이 모두 예산을 넘겨 떠났으면 토큰을 쓰지 않고 슬롯 반환
+        self.wait_stats.record(waited + time.monotonic() - start)
+        self.queue.release()
+        raise LatencyBudgetExceeded("대기 중 예산이 지나 LLM을 호출하지 않았습니다")
+
+    def _attempt(self, prompt):
+        """슬롯을 차지한 상태에서 LLM 호출 - 헤징에서 진 시도도 끝날 때까지 슬롯 유지"""
+        try:
+            self._count("llm_calls")
+            start = time.monotonic()
+            result = self.llm.invoke(prompt)
+            self.call_stats.record(time.monotonic() - start)
+            return result
+        finally:
+            self.queue.release()
+
+    def hedge_delay(self):
+        """헤징 호출을 보낼 지연(초) - 표본이 충분하면 단일 호출 p95, 아니면 기본값"""
+        if not self.hedge:
+            return None
+        if self.call_stats.count < self.hedge_min_samples:
+            return self.default_hedge_delay
+        return self.call_stats.percentile(95)
+
+    def _hedged_invoke(self, prompt):
+        """p95보다 늦으면 같은 요청을 한 번 더 보내고 먼저 온 응답 사용"""
+        start = time.monotonic()
+        attempts = [run_in_thread(self._attempt, prompt)]
+        delay = self.hedge_delay()
+        if delay is not None:
+            done, _ = wait(attempts, timeout=delay)
+            # 헤징도 Gemini 호출이므로 빈 슬롯과 토큰이 바로 있을 때만 보냄
+            if not done and self.queue.try_acquire():
+                if self.bucket is None or self.bucket.try_acquire():
+                    self._count("hedges")
+                    attempts.append(run_in_thread(self._attempt, prompt))
+                else:
+                    self.queue.release()
+
+        pending = set(attempts)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not attempts[0]:
+                        self._count("hedge_wins")
+                    self.hedged_stats.record(time.monotonic() - start)
+                    return future.result()
+        raise attempts[0].exception()
+
+    def as_runnable(self, session_id="default", budget=None):
+        """RAG 체인에 `| llm |` 대신 끼워 넣을 Runnable"""
+        return RunnableLambda(lambda prompt: self.invoke(prompt, session_id, budget))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["inflight"] = len(self._inflight)
+        stats["queue_depth"] = self.queue.depth
+        stats["max_queue_depth"] = self.queue.max_depth
+        stats["active"] = self.queue.active
+        stats["wait"] = self.wait_stats.summary()
+        stats["latency"] = self.call_stats.summary()
+        stats["latency_hedged"] = self.hedged_stats.summary()
+        return stats
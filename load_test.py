@@ -0,0 +1,459 @@
+"""유니코 AI - 동시 다중 세션 부하 테스트
+
+Streamlit AppTest로 unico_ai.py를 헤드리스로 실행해 N개 세션을 동시에 흉내 냅니다.
+Gemini는 지연만 흉내 내는 가짜 LLM, Telegram은 로컬 스텁 서버로 대체합니다.
+
+세션 수마다 별도 프로세스에서 측정하며 다음을 보고합니다.
+- 처리량 (질문/초), 질문별 응답 지연 p50/p95/p99
+- 세션당 RSS 증가량, 세션 상태(full_text + chat_history) 크기
+- 실제 LLM 호출 수 (게이트웨이 병합 효과), 벡터 DB 문서 수
+
+AppTest는 원래 모든 세션에 같은 session_id를 쓰므로, 가상 세션마다 고유 ID를 넣어
+게이트웨이의 공정 대기열이 세션별로 동작하게 합니다.
+
+사용법:
+    python load_test.py                              # 1, 2, 4, 8 세션
+    python load_test.py --sessions 1,4,16 --questions 6 --llm-latency 2
+    python load_test.py --prebuilt                   # 사전 빌드 인덱스(메모리 맵) 경로 측정
+    python load_test.py --json results.json
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+
+from llm_gateway import LatencyStats
+
+APP_PATH = Path(__file__).resolve().parent / "unico_ai.py"
+QUICK_BUTTONS = ["🌾 재배법 요약", "🌡️ 환경 조건", "🐛 병충해 관리", "💰 수익성 분석"]
+TELEGRAM_CHAT_ID = "123456789"
+
+# AppTest 세션 상태 id → 가상 세션 ID (concurrent_apptest가 스크립트 실행에 넣어 줌)
+SESSION_IDS = {}
+
+
+# --- 가짜 LLM / 임베딩 ---
+class FakeChatModel:
+    """ChatGoogleGenerativeAI 대역 - 지연 후 고정 형식 답변"""
+
+    latency = 1.0
+    calls = 0
+    _lock = threading.Lock()
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def invoke(self, prompt):
+        with FakeChatModel._lock:
+            FakeChatModel.calls += 1
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        return AIMessage(content=f"🌱 [부하 테스트 답변] 프롬프트 {len(text):,}자를 분석했습니다.")
+
+
+def fake_embeddings():
+    return DeterministicFakeEmbedding(size=384)
+
+
+@contextlib.contextmanager
+def patched_models(real_embeddings=False):
+    """앱이 가짜 LLM(과 선택적으로 가짜 임베딩)을 쓰도록 교체"""
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(mock.patch("langchain_google_genai.ChatGoogleGenerativeAI", FakeChatModel))
+        if not real_embeddings:
+            stack.enter_context(mock.patch("index_artifact.create_embeddings", fake_embeddings))
+        yield
+
+
+# --- Telegram 스텁 ---
+class TelegramStub:
+    """sendMessage만 받아 주는 로컬 Telegram API"""
+
+    def __init__(self):
+        self.messages = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.messages += 1
+                body = json.dumps({"ok": True, "result": {"message_id": stub.messages}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+
+
+# --- 테스트용 PDF ---
+SAMPLE_LINES = [
+    "Tomato seedlings grow best at 20 to 25 C during the day and 15 to 18 C at night.",
+    "Keep relative humidity between 60 and 80 percent to prevent gray mold.",
+    "Supplemental LED lighting of 200 umol per m2 per second improves fruit set in winter.",
+    "Apply drip fertigation with EC 2.0 to 2.5 dS/m after the first truss flowers.",
+    "Whitefly and aphids are controlled with yellow sticky traps and predatory insects.",
+    "Remove side shoots weekly and keep a single stem on the high wire system.",
+    "Harvest when fruits reach the breaker stage for distant markets.",
+    "Production cost is dominated by heating, labor and substrate replacement.",
+]
+
+
+def write_sample_pdf(path, pages=12, lines_per_page=45):
+    """외부 라이브러리 없이 텍스트 PDF 생성"""
+    rng = random.Random(0)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    font_id = 3 + 2 * pages
+    for i in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>".encode()
+        )
+        lines = [f"Section {i + 1}.{n + 1} {rng.choice(SAMPLE_LINES)}" for n in range(lines_per_page)]
+        stream = "\n".join(["BT /F1 9 Tf 36 760 Td 11 TL"] + [f"({line}) '" for line in lines] + ["ET"]).encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    Path(path).write_bytes(out)
+
+
+# --- 메모리 ---
+def current_rss():
+    """현재 프로세스 RSS (바이트)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # /proc이 없으면 최대 RSS로 대체 (macOS는 바이트, Linux는 KB)
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+# --- 가상 세션 ---
+class SimulatedSession:
+    """AppTest 하나 = 브라우저 탭 하나"""
+
+    def __init__(self, session_no, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.session_no = session_no
+        # AppTest.secrets는 실행마다 전역 st.secrets를 바꿔치기해 동시 실행 시 서로 덮어쓰므로
+        # 작업 폴더의 .streamlit/secrets.toml을 공유
+        self.at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        self.session_id = f"load-test-session-{session_no}"
+        SESSION_IDS[id(self.at._session_state)] = self.session_id
+        self.latencies = []
+        self.load_sec = 0.0
+        self.errors = []
+
+    def _check(self, step):
+        for exc in self.at.exception:
+            self.errors.append(f"{step}: {exc.value}")
+        for err in self.at.error:
+            self.errors.append(f"{step}: {err.value}")
+
+    def start(self):
+        """첫 실행 - 고정 PDF 자동 로드"""
+        start = time.perf_counter()
+        self.at.run()
+        self.load_sec = time.perf_counter() - start
+        self._check("load")
+
+    def ask(self, number):
+        """빠른 분석 버튼을 먼저 누르고, 이후에는 세션별 질문 입력"""
+        if number < len(QUICK_BUTTONS):
+            button = next(b for b in self.at.button if b.label == QUICK_BUTTONS[number])
+            button.click()
+        else:
+            self.at.chat_input[0].set_value(f"[세션 {self.session_no}] 질문 {number}: 겨울철 야간 온도 관리 방법은?")
+        start = time.perf_counter()
+        self.at.run()
+        self.latencies.append(time.perf_counter() - start)
+        self._check(f"question {number}")
+
+    def send_telegram(self):
+        self.at.text_input(key="send_telegram_id").input(TELEGRAM_CHAT_ID)
+        next(b for b in self.at.button if b.label == "📤 텔레그램으로 전송").click()
+        self.at.run()
+        self._check("telegram")
+
+    def run(self, questions, telegram):
+        try:
+            self.start()
+            for number in range(questions):
+                self.ask(number)
+            if telegram:
+                self.send_telegram()
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+    def state_bytes(self):
+        """세션 상태 중 full_text + chat_history 크기"""
+        state = self.at.session_state
+        size = len(state["full_text"].encode("utf-8")) if "full_text" in state else 0
+        for question, answer in state["chat_history"] if "chat_history" in state else []:
+            size += len(question.encode("utf-8")) + len(answer.encode("utf-8"))
+        return size
+
+    def vector_docs(self):
+        """세션이 보는 벡터 DB의 문서 수"""
+        vectorstore = self.at.session_state["vectorstore"] if "vectorstore" in self.at.session_state else None
+        if vectorstore is None:
+            return 0
+        if hasattr(vectorstore, "num_chunks"):
+            return vectorstore.num_chunks
+        return vectorstore._collection.count()
+
+
+# --- 측정 (세션 수 하나 = 프로세스 하나) ---
+def write_secrets(workdir, secrets):
+    """작업 폴더에 .streamlit/secrets.toml 작성"""
+    lines = []
+    for section, values in secrets.items():
+        lines.append(f"[{section}]")
+        lines.extend(f"{key} = {json.dumps(value)}" for key, value in values.items())
+    secrets_dir = Path(workdir) / ".streamlit"
+    secrets_dir.mkdir(exist_ok=True)
+    (secrets_dir / "secrets.toml").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+@contextlib.contextmanager
+def concurrent_apptest():
+    """AppTest를 여러 스레드에서 동시에 돌리기 위한 보정
+
+    - AppTest는 실행마다 global.appTest 옵션을 켰다가 되돌리므로 미리 켜 둠
+    - 실행이 끝나면 전역 Runtime을 지우므로, 다른 세션 실행 중에는 마지막 Runtime을 계속 사용
+    - 실행마다 스크립트를 새로 컴파일하는데, Python 3.11은 여러 스레드의 동시 컴파일에서
+      AST 오류가 나므로 컴파일만 직렬화 (실제 서버는 컴파일된 스크립트를 공유)
+    - AppTest는 session_id를 "test session id"로 고정하므로, 가상 세션별 ID로 바꿔
+      get_script_run_ctx().session_id가 세션마다 달라지게 함
+    """
+    from streamlit import config
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    compile_lock = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+    runner_init = LocalScriptRunner.__init__
+    last_runtime = []
+
+    def runner_init_with_session_id(self, script_path, session_state, *args, **kwargs):
+        runner_init(self, script_path, session_state, *args, **kwargs)
+        self._session_id = SESSION_IDS.get(id(session_state), self._session_id)
+
+    def locked_get_bytecode(self, script_path):
+        with compile_lock:
+            return get_bytecode(self, script_path)
+
+    def runtime_instance(cls):
+        if cls._instance is not None:
+            last_runtime[:] = [cls._instance]
+        if not last_runtime:
+            raise RuntimeError("Runtime hasn't been created!")
+        return last_runtime[0]
+
+    def runtime_exists(cls):
+        return cls._instance is not None or bool(last_runtime)
+
+    config.set_option("global.appTest", True)
+    with mock.patch.object(ScriptCache, "get_bytecode", locked_get_bytecode), \
+            mock.patch.object(LocalScriptRunner, "__init__", runner_init_with_session_id), \
+            mock.patch.object(Runtime, "instance", classmethod(runtime_instance)), \
+            mock.patch.object(Runtime, "exists", classmethod(runtime_exists)):
+        yield
+
+
+def run_level(args, sessions):
+    os.chdir(args.workdir)
+    FakeChatModel.latency = args.llm_latency
+
+    with TelegramStub() as stub, patched_models(args.real_embeddings), concurrent_apptest():
+        secrets = {
+            "gemini": {"api_key": "load-test"},
+            "telegram": {"bot_token": "load-test", "api_base": stub.url},
+        }
+        if args.rate_limit is not None:
+            secrets["gateway"] = {"rate_per_sec": args.rate_limit}
+        write_secrets(args.workdir, secrets)
+
+        # 워밍업 - 모델/캐시 로드는 세션 비용에서 제외
+        warmup = SimulatedSession(0, args.timeout)
+        warmup.run(1, telegram=False)
+        if warmup.errors:
+            raise RuntimeError(f"워밍업 실패: {warmup.errors[:3]}")
+        del warmup
+        gc.collect()
+
+        llm_calls_before = FakeChatModel.calls
+        messages_before = stub.messages
+        rss_before = current_rss()
+
+        simulated = [SimulatedSession(i + 1, args.timeout) for i in range(sessions)]
+        threads = [
+            threading.Thread(target=session.run, args=(args.questions, not args.no_telegram))
+            for session in simulated
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_sec = time.perf_counter() - start
+
+        gc.collect()
+        rss_after = current_rss()
+
+    latency = LatencyStats(window=sessions * args.questions)
+    load = LatencyStats(window=sessions)
+    for session in simulated:
+        for seconds in session.latencies:
+            latency.record(seconds)
+        load.record(session.load_sec)
+    errors = [error for session in simulated for error in session.errors]
+
+    return {
+        "sessions": sessions,
+        "questions": latency.count,
+        "wall_sec": wall_sec,
+        "throughput_qps": latency.count / wall_sec if wall_sec else 0.0,
+        "latency": latency.summary(),
+        "load": load.summary(),
+        "rss_per_session_mb": (rss_after - rss_before) / sessions / 2**20,
+        "rss_total_mb": rss_after / 2**20,
+        "state_kb_per_session": sum(s.state_bytes() for s in simulated) / sessions / 1024,
+        "vector_docs": max(s.vector_docs() for s in simulated),
+        "llm_calls": FakeChatModel.calls - llm_calls_before,
+        "telegram_sent": stub.messages - messages_before,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }
+
+
+# --- 보고 ---
+def print_report(results):
+    header = (
+        f"{'세션':>4} {'질문':>5} {'처리량/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'로드 p50':>8} "
+        f"{'RSS/세션':>9} {'상태/세션':>9} {'LLM 호출':>8} {'벡터 문서':>8} {'텔레그램':>7} {'오류':>4}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['sessions']:>4} {r['questions']:>5} {r['throughput_qps']:>8.2f} "
+            f"{r['latency']['p50']:>6.2f}s {r['latency']['p95']:>6.2f}s {r['latency']['p99']:>6.2f}s "
+            f"{r['load']['p50']:>7.2f}s {r['rss_per_session_mb']:>7.1f}MB {r['state_kb_per_session']:>7.1f}KB "
+            f"{r['llm_calls']:>8} {r['vector_docs']:>8} {r['telegram_sent']:>7} {r['errors']:>4}"
+        )
+        for error in r["error_samples"]:
+            print(f"     ⚠️ {error}")
+
+
+def prepare_workdir(args):
+    """fixed_pdfs(+ 선택적으로 indexes)가 있는 임시 작업 폴더"""
+    workdir = Path(tempfile.mkdtemp(prefix="unico_load_"))
+    pdf_dir = workdir / "fixed_pdfs"
+    pdf_dir.mkdir()
+    if args.pdf:
+        shutil.copy(args.pdf, pdf_dir / Path(args.pdf).name)
+    else:
+        write_sample_pdf(pdf_dir / "load_test_sample.pdf")
+
+    if args.prebuilt:
+        import build_index
+        embeddings_patch = (
+            contextlib.nullcontext() if args.real_embeddings
+            else mock.patch("build_index.create_embeddings", fake_embeddings)
+        )
+        with embeddings_patch:
+            build_index.main(["--pdf-dir", str(pdf_dir), "--out", str(workdir / "indexes")])
+    return workdir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="유니코 AI 동시 다중 세션 부하 테스트")
+    parser.add_argument("--sessions", default="1,2,4,8", help="동시 세션 수 목록 (기본: 1,2,4,8)")
+    parser.add_argument("--questions", type=int, default=4, help="세션당 질문 수 (앞 4개는 빠른 분석 버튼)")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="가짜 LLM 평균 지연(초)")
+    parser.add_argument("--rate-limit", type=float, default=None,
+                        help="게이트웨이 초당 호출 제한 덮어쓰기 (0이면 제한 없음, 기본: 앱 설정)")
+    parser.add_argument("--pdf", type=Path, help="테스트할 PDF (기본: 생성한 샘플 PDF)")
+    parser.add_argument("--prebuilt", action="store_true", help="사전 빌드 인덱스를 만들어 메모리 맵 경로로 측정")
+    parser.add_argument("--real-embeddings", action="store_true", help="가짜 대신 실제 임베딩 모델 사용")
+    parser.add_argument("--no-telegram", action="store_true", help="텔레그램 전송 단계 생략")
+    parser.add_argument("--timeout", type=float, default=120, help="AppTest 실행당 제한 시간(초)")
+    parser.add_argument("--json", type=Path, help="결과를 JSON으로 저장")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_level(args, args.worker)))
+        return 0
+
+    workdir = prepare_workdir(args)
+    argv = list(sys.argv[1:] if argv is None else argv)
+    results = []
+    try:
+        for sessions in [int(n) for n in args.sessions.split(",")]:
+            print(f"🚜 {sessions}개 세션 측정 중...", file=sys.stderr)
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), *argv,
+                 "--worker", str(sessions), "--workdir", str(workdir)],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                print(proc.stderr[-2000:], file=sys.stderr)
+                return proc.returncode
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""유니코 AI - 2단계 검색 (Cross-Encoder 재순위화)
+
+벡터 검색으로 넓게 후보를 뽑고, CPU 다국어 Cross-Encoder로 질문-청크 관련도를 다시 매겨
+기준 점수 이상인 청크만 LLM에 보냅니다. 집중된 질문일수록 프롬프트가 짧아져 Gemini 응답이 빨라집니다.
+
+- 작은 배치 단위로 점수 계산, 벡터 검색부터 잰 단계 전체 시간 상한(max_seconds)을
+  지난 배치 측정값으로 예상해 넘길 배치는 시작하지 않음
+- 기준 점수(cutoff)와 최소/최대 개수로 k를 질문마다 조정
+"""
+import time
+from typing import Any
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from llm_gateway import LatencyStats
+
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+class CrossEncoderReranker:
+    """질문-청크 쌍을 배치로 채점하는 재순위화기"""
+
+    def __init__(self, model_name=RERANK_MODEL, batch_size=4, max_seconds=1.5, model=None):
+        if model is None:
+            # 재순위화를 켤 때만 모델 로드
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(model_name, max_length=512, device="cpu")
+        self.model = model
+        self.batch_size = batch_size
+        self.max_seconds = max_seconds
+        self.latency = LatencyStats()
+        self.pair_latency = LatencyStats(window=200)
+        self.truncated = 0
+
+    def estimate_batch_seconds(self, size):
+        """지난 배치들의 쌍당 p95 시간으로 배치 비용 예상 (측정 전이면 0)"""
+        return size * self.pair_latency.percentile(95)
+
+    def rerank(self, query, docs, started=None):
+        """[(문서, 점수)]를 점수 내림차순으로 반환 - 시간 상한으로 채점 못한 문서는 점수 None으로 뒤에 붙음
+
+        started: 단계 시작 시각(time.monotonic) - 벡터 검색 시간까지 상한에 포함할 때 전달
+        """
+        start = started if started is not None else time.monotonic()
+        scores = []
+        for i in range(0, len(docs), self.batch_size):
+            batch = docs[i:i + self.batch_size]
+            if time.monotonic() - start + self.estimate_batch_seconds(len(batch)) > self.max_seconds:
+                self.truncated += 1
+                break
+            pairs = [(query, doc.page_content) for doc in batch]
+            batch_start = time.monotonic()
+            scores.extend(float(s) for s in self.model.predict(pairs, batch_size=self.batch_size))
+            self.pair_latency.record((time.monotonic() - batch_start) / len(batch))
+        self.latency.record(time.monotonic() - start)
+
+        scored = sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+        return scored + [(doc, None) for doc in docs[len(scores):]]
+
+
+def select_adaptive(scored, cutoff, min_k, max_k):
+    """기준 점수 이상만 남기되 최소 min_k, 최대 max_k개
+
+    시간 상한으로 채점하지 못한 후보는 관련도를 모르므로 벡터 검색 순서대로 max_k까지 채움
+    (재순위화가 느려도 끈 것보다 문맥이 줄지 않도록)
+    """
+    selected = [doc for doc, score in scored if score is not None and score >= cutoff][:max_k]
+    unscored = [doc for doc, score in scored if score is None]
+    selected.extend(unscored[:max_k - len(selected)])
+    chosen = {id(doc) for doc in selected}
+    for doc, _ in scored:
+        if len(selected) >= min_k:
+            break
+        if id(doc) not in chosen:
+            selected.append(doc)
+            chosen.add(id(doc))
+    return selected
+
+
+class RerankingRetriever(BaseRetriever):
+    """벡터 검색 후보를 Cross-Encoder로 재순위화하는 리트리버"""
+
+    base_retriever: BaseRetriever
+    reranker: Any
+    cutoff: float = 0.2
+    min_k: int = 2
+    max_k: int = 5
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        # 시간 상한은 벡터 검색부터 재순위화까지 단계 전체에 적용
+        started = time.monotonic()
+        candidates = self.base_retriever.invoke(query)
+        scored = self.reranker.rerank(query, candidates, started=started)
+        scores = {id(doc): score for doc, score in scored}
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": scores[id(doc)]})
+            for doc in select_adaptive(scored, self.cutoff, self.min_k, self.max_k)
+        ]
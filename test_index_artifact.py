@@ -0,0 +1,121 @@
+"""사전 빌드 인덱스 테스트 - 양자화 검색 순위, 블록 점수 계산, 빈 인덱스, 아티팩트 무효화
+
+실행: python -m pytest -q
+"""
+from unittest import mock
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+import index_artifact
+from index_artifact import QuantizedIndex, is_artifact_current, quantize, read_manifest, write_artifact
+
+
+def random_unit_vectors(rows, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_index(vectors, dtype):
+    stored, scales = quantize(vectors, dtype)
+    documents = [Document(page_content=str(i)) for i in range(len(vectors))]
+    return QuantizedIndex(stored, scales, documents, embedding=None, manifest={"dtype": dtype})
+
+
+@pytest.mark.parametrize("dtype, min_overlap", [("float16", 10), ("int8", 9)])
+def test_quantized_ranking_matches_float32(dtype, min_overlap):
+    vectors = random_unit_vectors(500)
+    queries = random_unit_vectors(20, seed=1)
+    index = make_index(vectors, dtype)
+
+    for query in queries:
+        exact = np.argsort(-(vectors @ query))[:10]
+        results = index.similarity_search_with_score_by_vector(query, k=10)
+        actual = [int(doc.page_content) for doc, _ in results]
+
+        assert actual[0] == exact[0]
+        assert len(set(actual) & set(exact.tolist())) >= min_overlap
+        for i, (_, score) in zip(actual, results):
+            assert score == pytest.approx(float(vectors[i] @ query), abs=0.01)
+
+
+def test_int8_scales_restored_across_score_blocks(monkeypatch):
+    monkeypatch.setattr(index_artifact, "SCORE_BLOCK_ROWS", 64)
+    # 행마다 크기를 달리해 스케일이 블록마다 다르게
+    vectors = random_unit_vectors(300) * np.linspace(0.1, 10, 300, dtype=np.float32)[:, None]
+    query = random_unit_vectors(1, seed=2)[0]
+    index = make_index(vectors, "int8")
+
+    expected = (index.vectors.astype(np.float32) * index.scales[:, None]) @ query
+    np.testing.assert_allclose(index._scores(query), expected, rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(index._scores(query), vectors @ query, atol=0.1)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_empty_index_returns_nothing(dtype):
+    index = make_index(np.zeros((0, 64), dtype=np.float32), dtype)
+    query = random_unit_vectors(1)[0]
+
+    assert index.similarity_search_with_score_by_vector(query, k=4) == []
+    assert index.max_marginal_relevance_search_by_vector(query, k=4, fetch_k=20) == []
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    pdf_path = tmp_path / "farm.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4 original")
+    documents = [Document(page_content="토마토 재배 환경 " * 10, metadata={"page": 0})]
+    out_dir = tmp_path / "indexes" / "farm"
+    write_artifact(out_dir, pdf_path, documents, documents, random_unit_vectors(1, dim=8), "int8")
+    return pdf_path, out_dir
+
+
+def test_current_artifact_is_accepted(artifact):
+    pdf_path, out_dir = artifact
+
+    assert is_artifact_current(read_manifest(out_dir), pdf_path)
+
+
+def test_artifact_rejected_when_pdf_changes(artifact):
+    pdf_path, out_dir = artifact
+    pdf_path.write_bytes(b"%PDF-1.4 edited")
+
+    assert not is_artifact_current(read_manifest(out_dir), pdf_path)
+
+
+def test_artifact_rejected_when_config_changes(artifact, monkeypatch):
+    pdf_path, out_dir = artifact
+    monkeypatch.setattr(index_artifact, "CHUNK_SIZE", index_artifact.CHUNK_SIZE + 1)
+
+    assert not is_artifact_current(read_manifest(out_dir), pdf_path)
+
+
+def test_app_picks_up_index_built_after_first_load(tmp_path, monkeypatch):
+    """아티팩트가 없던 상태가 캐시되지 않고, 나중에 빌드한 인덱스를 재시작 없이 사용"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import build_index
+    import load_test
+
+    # 게이트웨이/모델 캐시는 프로세스 전역이라 다른 테스트의 설정이 남지 않도록 비움
+    st.cache_resource.clear()
+    pdf_dir = tmp_path / "fixed_pdfs"
+    pdf_dir.mkdir()
+    load_test.write_sample_pdf(pdf_dir / "sample.pdf", pages=2)
+    monkeypatch.chdir(tmp_path)
+
+    def prebuilt_message():
+        at = AppTest.from_file(str(load_test.APP_PATH), default_timeout=60)
+        at.secrets["gemini"] = {"api_key": "test"}
+        at.run()
+        assert not at.exception
+        return any("사전 빌드 인덱스 사용" in s.value for s in at.success)
+
+    with load_test.patched_models():
+        assert not prebuilt_message()
+        with mock.patch("build_index.create_embeddings", load_test.fake_embeddings):
+            assert build_index.main(["--pdf-dir", str(pdf_dir), "--out", str(tmp_path / "indexes")]) == 0
+        assert prebuilt_message()
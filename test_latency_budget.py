@@ -0,0 +1,148 @@
+"""지연 예산 / 헤징 테스트 - 헤징 슬롯, 예산 초과, 결과 재사용, 발췌 답변
+
+실행: python -m pytest -q
+"""
+import time
+
+import pytest
+
+from llm_gateway import LatencyBudgetExceeded, LLMGateway, TokenBucket
+from test_llm_gateway import FakeLLM, run_concurrently, wait_until
+
+
+def test_hedges_respect_concurrency_cap():
+    llm = FakeLLM(latency=0.3)
+    gateway = LLMGateway(llm, max_concurrency=2, hedge=True, hedge_delay=0.05)
+
+    run_concurrently(gateway.invoke, [(f"질문 {i}", f"s{i}") for i in range(4)])
+
+    assert llm.peak <= 2
+
+
+def test_losing_hedge_attempt_holds_its_slot():
+    llm = FakeLLM(latency=0.3)
+    gateway = LLMGateway(llm, max_concurrency=3, hedge=True, hedge_delay=0.05)
+
+    assert gateway.invoke("질문") == "answer: 질문"
+    assert gateway.stats()["hedges"] == 1
+    # 먼저 끝난 시도가 반환된 뒤에도 진 시도는 끝날 때까지 슬롯을 잡고 있음
+    assert gateway.queue.active == 1
+    wait_until(lambda: gateway.queue.active == 0)
+
+
+def test_hedge_delay_switches_to_p95_after_enough_samples():
+    gateway = LLMGateway(FakeLLM(), hedge=True, hedge_min_samples=3, hedge_delay=8)
+
+    assert gateway.hedge_delay() == 8
+    for seconds in (0.1, 0.2):
+        gateway.call_stats.record(seconds)
+    assert gateway.hedge_delay() == 8
+
+    gateway.call_stats.record(0.3)
+    assert gateway.hedge_delay() == pytest.approx(0.3)
+    assert LLMGateway(FakeLLM(), hedge=False, hedge_delay=8).hedge_delay() is None
+
+
+@pytest.mark.parametrize("budget", [None, 5])
+def test_llm_timeout_error_is_not_reported_as_budget_exceeded(budget):
+    error = TimeoutError("read timed out")
+    gateway = LLMGateway(FakeLLM(error=error), budget=budget)
+
+    with pytest.raises(TimeoutError) as excinfo:
+        gateway.invoke("질문")
+
+    assert excinfo.value is error
+    wait_until(lambda: gateway.stats()["inflight"] == 0)
+    assert gateway.stats()["timeouts"] == 0
+    assert gateway.stats()["errors"] == 1
+
+
+def test_budget_exceeded_and_finished_result_is_reused():
+    llm = FakeLLM(latency=0.3)
+    gateway = LLMGateway(llm, max_concurrency=1, budget=0.1, result_ttl=5)
+
+    with pytest.raises(LatencyBudgetExceeded):
+        gateway.invoke("느린 질문")
+    wait_until(lambda: gateway.stats()["inflight"] == 0)
+
+    assert gateway.invoke("느린 질문") == "answer: 느린 질문"
+    assert len(llm.calls) == 1
+    assert gateway.stats()["cache_hits"] == 1
+
+
+def test_expired_request_is_not_sent():
+    llm = FakeLLM(latency=0.3)
+    gateway = LLMGateway(llm, max_concurrency=1, budget=0.1)
+
+    results = run_concurrently(gateway.invoke, [("질문 1", "s1"), ("질문 2", "s2")])
+
+    assert all(isinstance(result, LatencyBudgetExceeded) for result in results)
+    wait_until(lambda: gateway.stats()["inflight"] == 0)
+    assert len(llm.calls) == 1
+    assert gateway.stats()["expired"] == 1
+
+
+def test_token_bucket_gives_up_at_deadline_without_taking_token():
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=1, capacity=1, clock=lambda: now[0], sleep=sleep)
+    bucket.acquire()
+
+    assert bucket.acquire(deadline=0.3) is False
+    assert now[0] == pytest.approx(0.3)
+    now[0] = 1.0
+    assert bucket.try_acquire()
+
+
+def test_expired_request_does_not_spend_bucket_token():
+    llm = FakeLLM()
+    gateway = LLMGateway(llm, max_concurrency=2, rate_per_sec=1, burst=1, budget=0.2)
+    gateway.invoke("첫 질문")
+    start = time.monotonic()
+
+    with pytest.raises(LatencyBudgetExceeded):
+        gateway.invoke("두 번째 질문")
+
+    # 토큰이 채워질 때(1초)까지 슬롯을 잡고 있지 않고 예산이 지나면 바로 반환
+    wait_until(lambda: gateway.stats()["inflight"] == 0, timeout=0.5)
+    assert gateway.queue.active == 0
+    assert gateway.stats()["expired"] == 1
+    time.sleep(max(0.0, 1.05 - (time.monotonic() - start)))
+    assert gateway.bucket.try_acquire()
+    assert llm.calls == ["첫 질문"]
+
+
+def test_app_shows_labelled_extractive_answer_and_allows_reask(tmp_path, monkeypatch):
+    """예산 초과 시 "AI 답변 아님" 표시가 붙은 발췌 답변, 같은 버튼으로 다시 질문 가능"""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import load_test
+
+    # 게이트웨이/모델 캐시는 프로세스 전역이라 다른 테스트의 설정이 남지 않도록 비움
+    st.cache_resource.clear()
+    (tmp_path / "fixed_pdfs").mkdir()
+    load_test.write_sample_pdf(tmp_path / "fixed_pdfs" / "sample.pdf", pages=2)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(load_test.FakeChatModel, "latency", 1.0)
+
+    with load_test.patched_models():
+        at = AppTest.from_file(str(load_test.APP_PATH), default_timeout=60)
+        at.secrets["gemini"] = {"api_key": "test"}
+        at.secrets["gateway"] = {"budget_sec": 0.1, "rate_per_sec": 0, "hedge": False, "result_ttl_sec": 0}
+        at.run()
+        button = next(b for b in at.button if b.label == load_test.QUICK_BUTTONS[0])
+        button.click().run()
+
+        question, answer = at.session_state.chat_history[-1]
+        assert answer.startswith("⚠️ **AI 응답 시간이 초과되어")
+        assert "AI가 생성한 답변이 아닙니다" in answer
+        assert "**[발췌 1 - " in answer
+        assert question in at.session_state.fallback_questions
+
+        next(b for b in at.button if b.label == load_test.QUICK_BUTTONS[0]).click().run()
+        assert len(at.session_state.chat_history) == 2
+        assert not at.exception
@@ -0,0 +1,161 @@
+"""LLM 게이트웨이 테스트 - 가짜 LLM으로 병합, 동시 실행 제한, 속도 제한, 공정 대기열 확인
+
+실행: python -m pytest -q
+"""
+import threading
+import time
+
+import pytest
+
+from llm_gateway import LLMGateway, TokenBucket
+
+
+class FakeLLM:
+    """호출 수, 동시 실행 수, 호출 순서를 기록하는 가짜 LLM"""
+
+    def __init__(self, latency=0.0, error=None, gate=None):
+        self.latency = latency
+        self.error = error
+        self.gate = gate
+        self.calls = []
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self._lock:
+            self.calls.append(prompt)
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        try:
+            if self.gate is not None:
+                self.gate.wait(5)
+            time.sleep(self.latency)
+            if self.error is not None:
+                raise self.error
+            return f"answer: {prompt}"
+        finally:
+            with self._lock:
+                self.current -= 1
+
+
+def run_concurrently(fn, args_list):
+    """args마다 스레드로 fn을 실행하고 (결과 또는 예외) 목록 반환"""
+    results = [None] * len(args_list)
+
+    def target(i, args):
+        try:
+            results[i] = fn(*args)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=target, args=(i, args)) for i, args in enumerate(args_list)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return results
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "조건을 기다리다 시간 초과"
+        time.sleep(0.005)
+
+
+def test_identical_prompts_are_coalesced():
+    llm = FakeLLM(latency=0.2)
+    gateway = LLMGateway(llm, max_concurrency=4)
+
+    results = run_concurrently(gateway.invoke, [("같은 질문", f"s{i}") for i in range(8)])
+
+    assert results == ["answer: 같은 질문"] * 8
+    assert llm.calls == ["같은 질문"]
+    stats = gateway.stats()
+    assert stats["requests"] == 8
+    assert stats["coalesced"] == 7
+    assert stats["inflight"] == 0
+
+
+def test_max_concurrency_caps_simultaneous_calls():
+    llm = FakeLLM(latency=0.1)
+    gateway = LLMGateway(llm, max_concurrency=2)
+
+    results = run_concurrently(gateway.invoke, [(f"질문 {i}", f"s{i}") for i in range(6)])
+
+    assert results == [f"answer: 질문 {i}" for i in range(6)]
+    assert llm.peak == 2
+    assert gateway.stats()["max_queue_depth"] >= 1
+
+
+def test_token_bucket_waits_for_refill():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=1, clock=lambda: now[0], sleep=sleep)
+
+    bucket.acquire()
+    assert sleeps == []
+    bucket.acquire()
+    assert sleeps == [pytest.approx(0.5)]
+    assert not bucket.try_acquire()
+    now[0] += 0.5
+    assert bucket.try_acquire()
+
+
+def test_gateway_waits_for_bucket_token():
+    llm = FakeLLM()
+    gateway = LLMGateway(llm, max_concurrency=4, rate_per_sec=10, burst=1)
+
+    gateway.invoke("첫 질문")
+    gateway.invoke("두 번째 질문")
+
+    assert gateway.wait_stats.summary()["max"] >= 0.08
+
+
+def test_sessions_are_served_round_robin():
+    gate = threading.Event()
+    llm = FakeLLM(gate=gate)
+    gateway = LLMGateway(llm, max_concurrency=1)
+
+    threads = [threading.Thread(target=gateway.invoke, args=("막는 질문", "s0"))]
+    threads[0].start()
+    wait_until(lambda: llm.calls == ["막는 질문"])
+
+    # 세션 a가 먼저 3개를 쌓고 세션 b가 1개를 넣음
+    for depth, (prompt, session_id) in enumerate([("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")], 1):
+        thread = threading.Thread(target=gateway.invoke, args=(prompt, session_id))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: gateway.queue.depth == depth)
+
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert llm.calls == ["막는 질문", "a1", "b1", "a2", "a3"]
+
+
+def test_error_propagates_to_coalesced_waiters():
+    gate = threading.Event()
+    error = RuntimeError("quota exceeded")
+    llm = FakeLLM(error=error, gate=gate)
+    gateway = LLMGateway(llm, max_concurrency=2)
+
+    def release_when_coalesced():
+        wait_until(lambda: gateway.stats()["coalesced"] == 3)
+        gate.set()
+
+    releaser = threading.Thread(target=release_when_coalesced)
+    releaser.start()
+    results = run_concurrently(gateway.invoke, [("같은 질문", f"s{i}") for i in range(4)])
+    releaser.join(5)
+
+    assert all(result is error for result in results)
+    assert len(llm.calls) == 1
+    assert gateway.stats()["errors"] == 1
@@ -0,0 +1,89 @@
+"""재순위화 테스트 - 가짜 Cross-Encoder로 기준 점수 선택, 시간 상한, 상한 초과 시 문맥 유지 확인
+
+실행: python -m pytest -q
+"""
+import time
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from reranker import CrossEncoderReranker, RerankingRetriever, select_adaptive
+
+
+class FakeCrossEncoder:
+    """질문 단어가 들어 있으면 0.9, 아니면 0.1 - 쌍마다 pair_seconds만큼 걸림"""
+
+    def __init__(self, pair_seconds=0.0):
+        self.pair_seconds = pair_seconds
+        self.batches = []
+
+    def predict(self, pairs, batch_size=16):
+        self.batches.append(len(pairs))
+        time.sleep(self.pair_seconds * len(pairs))
+        return [0.9 if query in text else 0.1 for query, text in pairs]
+
+
+class FakeRetriever(BaseRetriever):
+    """벡터 검색 대역 - delay초 뒤 고정 후보 반환"""
+
+    texts: list
+    delay: float = 0.0
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        time.sleep(self.delay)
+        return [Document(page_content=text, metadata={"page": i}) for i, text in enumerate(self.texts)]
+
+
+TEXTS = [f"청크 {i} {'토마토' if i in (3, 7) else '기타'}" for i in range(20)]
+
+
+def make_retriever(pair_seconds=0.0, delay=0.0, max_seconds=1.5, max_k=5):
+    reranker = CrossEncoderReranker(model=FakeCrossEncoder(pair_seconds), batch_size=4, max_seconds=max_seconds)
+    return RerankingRetriever(
+        base_retriever=FakeRetriever(texts=TEXTS, delay=delay),
+        reranker=reranker, cutoff=0.2, min_k=2, max_k=max_k,
+    )
+
+
+def test_keeps_only_chunks_above_cutoff():
+    docs = make_retriever().invoke("토마토")
+
+    assert [doc.page_content for doc in docs] == [TEXTS[3], TEXTS[7]]
+    assert all(doc.metadata["rerank_score"] == 0.9 for doc in docs)
+
+
+def test_pads_to_min_k_when_nothing_passes_cutoff():
+    docs = make_retriever().invoke("오이")
+
+    assert len(docs) == 2
+    assert all(doc.metadata["rerank_score"] == 0.1 for doc in docs)
+
+
+def test_slow_retrieval_keeps_max_k_candidates_in_vector_order():
+    retriever = make_retriever(delay=0.3, max_seconds=0.2)
+
+    docs = retriever.invoke("토마토")
+
+    assert [doc.page_content for doc in docs] == TEXTS[:5]
+    assert all(doc.metadata["rerank_score"] is None for doc in docs)
+    assert retriever.reranker.model.batches == []
+    assert retriever.reranker.truncated == 1
+
+
+def test_stage_cap_includes_retrieval_and_estimated_batch_cost():
+    retriever = make_retriever(pair_seconds=0.05, delay=0.1, max_seconds=0.6)
+
+    start = time.monotonic()
+    docs = retriever.invoke("토마토")
+
+    assert time.monotonic() - start <= 0.6 + 0.05
+    # 0.1초 검색 + 배치당 0.2초 → 두 배치만 채점하고 나머지는 벡터 순서로 채움
+    assert retriever.reranker.model.batches == [4, 4]
+    assert [doc.page_content for doc in docs] == [TEXTS[3], TEXTS[7], TEXTS[8], TEXTS[9], TEXTS[10]]
+
+
+def test_select_adaptive_fills_unscored_after_scored_matches():
+    docs = [Document(page_content=str(i)) for i in range(6)]
+    scored = [(docs[1], 0.8), (docs[0], 0.1), (docs[2], None), (docs[3], None), (docs[4], None)]
+
+    assert select_adaptive(scored, cutoff=0.2, min_k=2, max_k=3) == [docs[1], docs[2], docs[3]]
@@ -1,12 +1,13 @@
 import streamlit as st
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_chroma import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.document_loaders import PyPDFLoader
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from llm_gateway import LLMGateway, LatencyBudgetExceeded
+from index_artifact import artifact_dir_for, build_full_text, create_embeddings, load_artifact_for, split_documents
+from reranker import CrossEncoderReranker, RerankingRetriever
 import requests
 import os
 import tempfile
@@ -139,6 +140,18 @@ def get_telegram_token():
 
 telegram_token = get_telegram_token()
 
+@st.cache_resource
+def get_telegram_api_base():
+    """Telegram API 주소 (부하 테스트 시 로컬 스텁으로 변경 가능)"""
+    try:
+        if 'telegram' in st.secrets and 'api_base' in st.secrets['telegram']:
+            return st.secrets['telegram']['api_base'].rstrip('/')
+    except:
+        pass
+    return "https://api.telegram.org"
+
+telegram_api_base = get_telegram_api_base()
+
 # --- Telegram 메시지 전송 함수 ---
 def send_telegram_message(chat_id, message):
     """텔레그램 메시지 전송"""
@@ -149,7 +162,7 @@ def send_telegram_message(chat_id, message):
         if not chat_id:
             return False, "Chat ID를 입력하세요"
         
-        url = f"https://api.telegram.org/bot{telegram_token}/sendMessage"
+        url = f"{telegram_api_base}/bot{telegram_token}/sendMessage"
         
         payload = {
             "chat_id": chat_id,
@@ -169,7 +182,23 @@ def send_telegram_message(chat_id, message):
     except Exception as e:
         return False, str(e)
 
+# --- LLM 게이트웨이 설정 (모든 세션 공유) ---
+# secrets.toml의 [gateway] 섹션으로 덮어쓸 수 있음
+gateway_settings = st.secrets.get('gateway', {})
+LLM_MAX_CONCURRENCY = gateway_settings.get('max_concurrency', 4)
+LLM_RATE_PER_SEC = gateway_settings.get('rate_per_sec', 0.25)
+LLM_BURST = gateway_settings.get('burst', 4)
+LLM_BUDGET_SEC = gateway_settings.get('budget_sec', 20)
+LLM_HEDGE = gateway_settings.get('hedge', True)
+LLM_HEDGE_DELAY_SEC = gateway_settings.get('hedge_delay_sec', 8)
+LLM_RESULT_TTL_SEC = gateway_settings.get('result_ttl_sec', 60)
+
 # --- 모델 초기화 ---
+# 예산이 지난 호출이 슬롯을 계속 잡지 않도록 클라이언트 타임아웃을 예산 이하로 두고,
+# 재시도는 게이트웨이(속도 제한/헤징)에 맡김
+LLM_REQUEST_TIMEOUT = LLM_BUDGET_SEC
+LLM_MAX_RETRIES = 0
+
 @st.cache_resource
 def init_models():
     """LLM과 임베딩 모델 초기화"""
@@ -178,19 +207,40 @@ def init_models():
         google_api_key=GOOGLE_API_KEY,
         temperature=0.1,
         convert_system_message_to_human=True,
-        max_output_tokens=2048
+        max_output_tokens=2048,
+        timeout=LLM_REQUEST_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES
     )
     
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    embeddings = create_embeddings()
     
     return llm, embeddings
 
 llm, embeddings = init_models()
 
+# --- LLM 게이트웨이 (모든 세션 공유) ---
+
+@st.cache_resource
+def init_gateway(_llm):
+    """동일 질문 병합 + 동시 실행/속도 제한 + 지연 예산 게이트웨이"""
+    return LLMGateway(
+        _llm,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        rate_per_sec=LLM_RATE_PER_SEC,
+        burst=LLM_BURST,
+        budget=LLM_BUDGET_SEC,
+        hedge=LLM_HEDGE,
+        hedge_delay=LLM_HEDGE_DELAY_SEC,
+        result_ttl=LLM_RESULT_TTL_SEC
+    )
+
+gateway = init_gateway(llm)
+
+def get_session_id():
+    """현재 Streamlit 세션 ID"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "default"
+
 # --- Session State 초기화 ---
 if 'vectorstore' not in st.session_state:
     st.session_state.vectorstore = None
@@ -200,6 +250,8 @@ if 'full_text' not in st.session_state:
     st.session_state.full_text = ""
 if 'search_k' not in st.session_state:
     st.session_state.search_k = 5
+if 'use_rerank' not in st.session_state:
+    st.session_state.use_rerank = False
 if 'pdf_pages' not in st.session_state:
     st.session_state.pdf_pages = 0
 if 'num_chunks' not in st.session_state:
@@ -208,6 +260,8 @@ if 'user_telegram_id' not in st.session_state:
     st.session_state.user_telegram_id = ""
 if 'current_question' not in st.session_state:
     st.session_state.current_question = None
+if 'fallback_questions' not in st.session_state:
+    st.session_state.fallback_questions = set()
 if 'auto_loaded' not in st.session_state:
     st.session_state.auto_loaded = False
 
@@ -244,11 +298,7 @@ def process_pdf(uploaded_file, embeddings):
             
             pdf_pages = len(documents)
             
-            total_text = ""
-            for doc in documents:
-                page_text = doc.page_content.strip()
-                if page_text:
-                    total_text += f"\n[페이지 {doc.metadata.get('page', 'Unknown')}]\n{page_text}\n"
+            total_text = build_full_text(documents)
             
             if len(total_text.strip()) < 50:
                 st.error("❌ PDF에 충분한 텍스트가 없습니다.")
@@ -268,14 +318,7 @@ def process_pdf(uploaded_file, embeddings):
                 st.info(f"🌾 전체 {len(total_text):,}글자 중 처음 5000자만 표시")
         
         with st.spinner("🚜 문서를 분석 단위로 경작 중..."):
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200,
-                separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""],
-                length_function=len
-            )
-            splits = text_splitter.split_documents(documents)
-            splits = [doc for doc in splits if len(doc.page_content.strip()) > 50]
+            splits = split_documents(documents)
         
         st.success(f"🌾 {len(splits)}개의 지식 단위로 분할 완료!")
         
@@ -297,19 +340,70 @@ def process_pdf(uploaded_file, embeddings):
         if os.path.exists(tmp_path):
             os.remove(tmp_path)
 
+# --- 고정 PDF 로드 (사전 빌드 인덱스 우선) ---
+@st.cache_resource
+def load_prebuilt_index(pdf_path, pdf_mtime, manifest_mtime, _embeddings):
+    """build_index.py로 만든 아티팩트를 메모리 맵으로 로드 (모든 세션 공유)
+
+    manifest_mtime도 캐시 키라서 앱 실행 중에 새로 빌드한 인덱스도 바로 사용
+    """
+    return load_artifact_for(Path(pdf_path), _embeddings)
+
+def load_fixed_pdf(pdf_path):
+    """사전 빌드 인덱스가 최신이면 그대로 쓰고, 아니면 PDF를 직접 처리"""
+    manifest_path = artifact_dir_for(pdf_path) / "manifest.json"
+    manifest_mtime = manifest_path.stat().st_mtime if manifest_path.exists() else None
+    index = load_prebuilt_index(str(pdf_path), pdf_path.stat().st_mtime, manifest_mtime, embeddings)
+    if index is not None:
+        st.success(f"⚡ 사전 빌드 인덱스 사용: {index.num_chunks}개 청크 ({index.manifest['dtype']})")
+        return index, index.num_chunks, index.full_text, index.pdf_pages
+    
+    class FixedFile:
+        def __init__(self, name, data):
+            self.name = name
+            self._data = data
+        def getvalue(self):
+            return self._data
+    
+    return process_pdf(FixedFile(pdf_path.name, pdf_path.read_bytes()), embeddings)
+
+# --- 재순위화 모델 (선택) ---
+RERANK_CANDIDATES = 20
+RERANK_CUTOFF = 0.2
+RERANK_MIN_K = 2
+RERANK_BATCH_SIZE = 4
+RERANK_MAX_SEC = 1.5
+
+@st.cache_resource
+def init_reranker():
+    """CPU 다국어 Cross-Encoder 로드 (모든 세션 공유)"""
+    return CrossEncoderReranker(batch_size=RERANK_BATCH_SIZE, max_seconds=RERANK_MAX_SEC)
+
 # --- RAG 체인 생성 ---
-def create_rag_chain(vectorstore, llm, search_k=5):
-    """농업 전문 RAG 체인 생성"""
+def create_rag_chain(vectorstore, llm, search_k=5, reranker=None):
+    """농업 전문 RAG 체인 생성
+    
+    reranker가 있으면 후보를 넓게 뽑아 재순위화하고, search_k는 최대 개수가 됩니다.
+    """
     
     retriever = vectorstore.as_retriever(
         search_type="mmr",
         search_kwargs={
-            "k": search_k,
-            "fetch_k": 20,
+            "k": RERANK_CANDIDATES if reranker else search_k,
+            "fetch_k": RERANK_CANDIDATES * 2 if reranker else 20,
             "lambda_mult": 0.5
         }
     )
     
+    if reranker:
+        retriever = RerankingRetriever(
+            base_retriever=retriever,
+            reranker=reranker,
+            cutoff=RERANK_CUTOFF,
+            min_k=RERANK_MIN_K,
+            max_k=search_k
+        )
+    
     template = """당신은 농업 및 스마트팜 전문 AI 조언자입니다. 🌱
 주어진 문서를 깊이 이해하고 실용적인 농업 인사이트를 제공합니다.
 
@@ -337,10 +431,11 @@ def create_rag_chain(vectorstore, llm, search_k=5):
             formatted += "=" * 50
         return formatted
     
+    # 검색은 한 번만 하고 그 결과를 답변 생성과 참고 문서 표시에 같이 사용
     rag_chain = (
         {
-            "context": retriever | format_docs,
-            "question": RunnablePassthrough()
+            "context": lambda inputs: format_docs(inputs["docs"]),
+            "question": lambda inputs: inputs["question"]
         }
         | prompt
         | llm
@@ -349,6 +444,21 @@ def create_rag_chain(vectorstore, llm, search_k=5):
     
     return rag_chain, retriever
 
+# --- 발췌 답변 (LLM 시간 초과 시) ---
+def build_extractive_answer(docs, max_chunks=3, max_chars=400):
+    """상위 검색 청크로 발췌 답변 구성"""
+    lines = [
+        "⚠️ **AI 응답 시간이 초과되어 문서에서 관련 부분을 발췌해 보여드립니다.** "
+        "(AI가 생성한 답변이 아닙니다. 잠시 후 다시 질문해주세요.)"
+    ]
+    for i, doc in enumerate(docs[:max_chunks], 1):
+        page = doc.metadata.get('page', '?')
+        text = " ".join(doc.page_content.split())
+        if len(text) > max_chars:
+            text = text[:max_chars] + "..."
+        lines.append(f"**[발췌 {i} - {page}페이지]** {text}")
+    return "\n\n".join(lines)
+
 # --- 헤더 ---
 col1, col2, col3 = st.columns([1, 2, 1])
 with col2:
@@ -431,6 +541,49 @@ with st.sidebar:
             </small>
         </div>
         """, unsafe_allow_html=True)
+        
+        st.session_state.use_rerank = st.toggle(
+            "🎯 재순위화 (Cross-Encoder)",
+            value=st.session_state.use_rerank,
+            help=f"후보 {RERANK_CANDIDATES}개를 다시 채점해 관련도 높은 청크만 사용합니다. 참고 문서 깊이가 최대 개수가 됩니다."
+        )
+        
+        if st.session_state.use_rerank:
+            try:
+                rerank_stats = init_reranker().latency.summary()
+                st.markdown(f"""
+                <div style='background: rgba(255,255,255,0.1); padding: 10px; border-radius: 10px; margin-top: 10px;'>
+                    <small style='color: white;'>
+                    ⏱️ 재순위화 {rerank_stats['count']}회 · p50 {rerank_stats['p50'] * 1000:.0f}ms / p95 {rerank_stats['p95'] * 1000:.0f}ms (상한 {RERANK_MAX_SEC}초)
+                    </small>
+                </div>
+                """, unsafe_allow_html=True)
+            except Exception as e:
+                st.warning(f"⚠️ 재순위화 모델을 불러올 수 없어 기본 검색을 사용합니다: {e}")
+                st.session_state.use_rerank = False
+    
+    with st.expander("📊 LLM 게이트웨이 현황", expanded=False):
+        gateway_stats = gateway.stats()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("⏳ 대기열", f"{gateway_stats['queue_depth']}", delta=f"최대 {gateway_stats['max_queue_depth']}")
+            st.metric("🤖 Gemini 호출", f"{gateway_stats['llm_calls']}")
+        with col2:
+            st.metric("⏱️ 평균 대기", f"{gateway_stats['wait']['mean']:.1f}초", delta=f"p95 {gateway_stats['wait']['p95']:.1f}초")
+            st.metric("🔗 병합된 요청", f"{gateway_stats['coalesced']}", delta=f"재사용 {gateway_stats['cache_hits']}")
+        
+        latency = gateway_stats['latency']
+        latency_hedged = gateway_stats['latency_hedged']
+        st.markdown(f"""
+        <div style='background: rgba(255,255,255,0.1); padding: 10px; border-radius: 10px; margin-top: 10px;'>
+            <small style='color: white;'>
+            ⏱️ 응답 지연 p50 / p95 / p99<br>
+            단일 호출: {latency['p50']:.1f} / {latency['p95']:.1f} / {latency['p99']:.1f}초<br>
+            헤징 적용: {latency_hedged['p50']:.1f} / {latency_hedged['p95']:.1f} / {latency_hedged['p99']:.1f}초<br>
+            🔁 헤징 {gateway_stats['hedges']}회 (승리 {gateway_stats['hedge_wins']}회) · ⌛ 시간 초과 {gateway_stats['timeouts']}회
+            </small>
+        </div>
+        """, unsafe_allow_html=True)
     
     st.markdown("---")
     
@@ -450,19 +603,10 @@ with st.sidebar:
         auto_pdf_path = auto_load_pdf()
         if auto_pdf_path and not st.session_state.auto_loaded:
             st.session_state.auto_loaded = True
-            data = auto_pdf_path.read_bytes()
-            
-            class FixedFile:
-                def __init__(self, name, data):
-                    self.name = name
-                    self._data = data
-                def getvalue(self):
-                    return self._data
             
             with st.spinner(f"🚀 자동으로 '{auto_pdf_path.name}' 로드 중..."):
-                st.session_state.vectorstore, st.session_state.num_chunks, st.session_state.full_text, st.session_state.pdf_pages = process_pdf(
-                    FixedFile(auto_pdf_path.name, data), 
-                    embeddings
+                st.session_state.vectorstore, st.session_state.num_chunks, st.session_state.full_text, st.session_state.pdf_pages = load_fixed_pdf(
+                    auto_pdf_path
                 )
         
         with st.expander("🔄 다른 PDF 선택", expanded=False):
@@ -478,17 +622,8 @@ with st.sidebar:
                 """, unsafe_allow_html=True)
 
                 if st.button('🌾 이 PDF 로드', type='primary', use_container_width=True):
-                    data = fp.read_bytes()
-                    class FixedFile:
-                        def __init__(self, name, data):
-                            self.name = name
-                            self._data = data
-                        def getvalue(self):
-                            return self._data
-
-                    st.session_state.vectorstore, st.session_state.num_chunks, st.session_state.full_text, st.session_state.pdf_pages = process_pdf(
-                        FixedFile(selected_pdf, data), 
-                        embeddings
+                    st.session_state.vectorstore, st.session_state.num_chunks, st.session_state.full_text, st.session_state.pdf_pages = load_fixed_pdf(
+                        fp
                     )
                     st.rerun()
     else:
@@ -522,6 +657,7 @@ with st.sidebar:
     if st.button('🔄 시스템 초기화', use_container_width=True):
         st.session_state.vectorstore = None
         st.session_state.chat_history = []
+        st.session_state.fallback_questions = set()
         st.session_state.full_text = ""
         st.session_state.pdf_pages = 0
         st.session_state.num_chunks = 0
@@ -671,7 +807,9 @@ else:
     if 'current_question' in st.session_state and st.session_state.current_question:
         question_to_process = st.session_state.current_question
         
-        if any(q == question_to_process for q, _ in st.session_state.chat_history):
+        # 발췌 답변만 받은 질문은 다시 물어볼 수 있음
+        if question_to_process not in st.session_state.fallback_questions and \
+                any(q == question_to_process for q, _ in st.session_state.chat_history):
             question_to_process = None
     else:
         question_to_process = None
@@ -686,22 +824,32 @@ else:
                 try:
                     rag_chain, retriever = create_rag_chain(
                         st.session_state.vectorstore, 
-                        llm,
-                        st.session_state.search_k
+                        gateway.as_runnable(get_session_id()),
+                        st.session_state.search_k,
+                        init_reranker() if st.session_state.use_rerank else None
                     )
                     
-                    response = rag_chain.invoke(question_to_process)
+                    docs = retriever.invoke(question_to_process)
+                    try:
+                        response = rag_chain.invoke({"docs": docs, "question": question_to_process})
+                        st.session_state.fallback_questions.discard(question_to_process)
+                    except LatencyBudgetExceeded:
+                        response = build_extractive_answer(docs)
+                        st.session_state.fallback_questions.add(question_to_process)
+                        # 다시 실행될 때 자동으로 재시도하지 않고, 사용자가 다시 물으면 처리
+                        st.session_state.current_question = None
                     st.write(response)
                     
                     st.session_state.chat_history.append((question_to_process, response))
                     
-                    with st.expander(f"🔍 참고한 문서 부분 ({st.session_state.search_k}개)"):
-                        docs = retriever.invoke(question_to_process)
+                    with st.expander(f"🔍 참고한 문서 부분 ({len(docs)}개)"):
                         for i, doc in enumerate(docs, 1):
                             page_num = doc.metadata.get('page', '?')
+                            score = doc.metadata.get('rerank_score')
+                            score_text = f" · 🎯 관련도 {score:.2f}" if score is not None else ""
                             st.markdown(f"""
                             <div style='background: #f1f8e9; padding: 10px; border-radius: 10px; margin: 10px 0;'>
-                                <h4 style='color: #33691e;'>[참고 {i}] 📄 {page_num}페이지</h4>
+                                <h4 style='color: #33691e;'>[참고 {i}] 📄 {page_num}페이지{score_text}</h4>
                                 <p style='color: #558b2f;'>{doc.page_content[:500]}...</p>
                             </div>
                             """, unsafe_allow_html=True)